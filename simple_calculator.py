@@ -15,87 +15,209 @@ from __future__ import annotations
 import ast
 import operator
 import sys
+from collections import OrderedDict
 from typing import Any, Callable, Mapping, Optional, Union
 
 
-class SafeEvaluator(ast.NodeVisitor):
-    """Avalia uma expressão matemática simples de forma segura.
-
-    Permite apenas números, operações binárias (+, -, *, /, //, %, **),
-    operações unárias (+, -) e parênteses. Qualquer outro elemento (nomes,
-    chamadas de função, atribuições etc.) é bloqueado.
-    """
+Number = Union[int, float]
+_BinaryFunc = Callable[[Number, Number], Number]
+_UnaryFunc = Callable[[Number], Number]
+
+# Tabelas de despacho em nível de módulo, ligadas como argumentos padrão
+# em SafeEvaluator._eval para que a busca seja um LOAD_FAST.
+_BIN_OPS: Mapping[type[ast.AST], _BinaryFunc] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
 
-    Number = Union[int, float]
+_UN_OPS: Mapping[type[ast.AST], _UnaryFunc] = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
 
-    _binary_operators: Mapping[type[ast.AST], Callable[[Number, Number], Number]] = {
-        ast.Add: operator.add,
-        ast.Sub: operator.sub,
-        ast.Mult: operator.mul,
-        ast.Div: operator.truediv,
-        ast.FloorDiv: operator.floordiv,
-        ast.Mod: operator.mod,
-        ast.Pow: operator.pow,
-    }
 
-    _unary_operators: Mapping[type[ast.AST], Callable[[Number], Number]] = {
-        ast.UAdd: operator.pos,
-        ast.USub: operator.neg,
+# Tipos de nó aceitos numa expressão; verificados por _validate
+_ALLOWED_NODES = frozenset(
+    {
+        ast.Expression,
+        ast.BinOp,
+        ast.UnaryOp,
+        ast.Constant,
+        *_BIN_OPS,
+        *_UN_OPS,
     }
+)
 
-    def visit_Expression(self, node: ast.Expression) -> Any:  # type: ignore[override]
-        return self.visit(node.body)
-
-    def visit_BinOp(self, node: ast.BinOp) -> Any:  # type: ignore[override]
-        left = self.visit(node.left)
-        right = self.visit(node.right)
-        op_type = type(node.op)
 
-        if op_type not in self._binary_operators:
-            raise ValueError("Operador binário não suportado")
+def _validate(tree: ast.AST) -> None:
+    """Verifica, numa única passada, se a AST só contém elementos permitidos.
 
-        func = self._binary_operators[op_type]
-        return func(left, right)
-
-    def visit_UnaryOp(self, node: ast.UnaryOp) -> Any:  # type: ignore[override]
-        operand = self.visit(node.operand)
-        op_type = type(node.op)
-
-        if op_type not in self._unary_operators:
-            raise ValueError("Operador unário não suportado")
-
-        func = self._unary_operators[op_type]
-        return func(operand)
-
-    def visit_Constant(self, node: ast.Constant) -> Any:  # type: ignore[override]
-        value = node.value
-        if isinstance(value, bool):
-            # Evita True/False (subclasses de int)
-            raise ValueError("Valores booleanos não são permitidos")
-        if not isinstance(value, (int, float)):
-            raise ValueError("Apenas números são permitidos")
-        return value
+    Lança ValueError no primeiro elemento proibido, antes de qualquer cálculo.
+    """
+    for node in ast.walk(tree):
+        node_type = node.__class__
+        if node_type not in _ALLOWED_NODES:
+            if isinstance(node, ast.operator):
+                raise ValueError("Operador binário não suportado")
+            if isinstance(node, ast.unaryop):
+                raise ValueError("Operador unário não suportado")
+            raise ValueError(
+                f"Expressão contém elemento não permitido: {node_type.__name__}"
+            )
+        if node_type is ast.Constant:
+            value = node.value
+            if isinstance(value, bool):
+                # Evita True/False (subclasses de int)
+                raise ValueError("Valores booleanos não são permitidos")
+            if not isinstance(value, (int, float)):
+                raise ValueError("Apenas números são permitidos")
+
+
+class SafeEvaluator:
+    """Avalia uma expressão matemática simples de forma segura.
 
-    # Compatibilidade com versões antigas do Python
-    def visit_Num(self, node: ast.Num) -> Any:  # type: ignore[override]
-        return self.visit_Constant(ast.Constant(node.n))
+    Permite apenas números, operações binárias (+, -, *, /, //, %, **),
+    operações unárias (+, -) e parênteses. Qualquer outro elemento (nomes,
+    chamadas de função, atribuições etc.) é bloqueado.
+    """
 
-    def generic_visit(self, node: ast.AST) -> Any:  # type: ignore[override]
-        raise ValueError(
-            f"Expressão contém elemento não permitido: {node.__class__.__name__}"
-        )
+    Number = Number
+
+    # Sem estado por instância: todas as tabelas ficam no módulo
+    __slots__ = ()
+
+    def evaluate(self, tree: ast.AST) -> Any:
+        """Valida a AST inteira e retorna o valor da expressão.
+
+        Lança ValueError no primeiro elemento proibido, antes de qualquer
+        cálculo; erros aritméticos (ex.: divisão por zero) são propagados.
+        """
+        _validate(tree)
+        return self._eval(tree)
+
+    def _eval(
+        self,
+        node: ast.AST,
+        _bin_ops: Mapping[type[ast.AST], _BinaryFunc] = _BIN_OPS,
+        _un_ops: Mapping[type[ast.AST], _UnaryFunc] = _UN_OPS,
+    ) -> Any:
+        # Espera uma árvore já validada. Percurso pós-ordem iterativo: uma
+        # pilha de trabalho com nós e operações pendentes (função, aridade) e
+        # uma pilha de valores, sem um frame Python por nó. Os operandos são
+        # calculados da esquerda para a direita e o primeiro erro aritmético
+        # interrompe o cálculo.
+        work: list[Any] = [node]
+        values: list[Any] = []
+        while work:
+            item = work.pop()
+            t = item.__class__
+            if t is tuple:
+                func, arity = item
+                if arity == 2:
+                    right = values.pop()
+                    values[-1] = func(values[-1], right)
+                else:
+                    values[-1] = func(values[-1])
+            elif t is ast.BinOp:
+                work.append((_bin_ops[item.op.__class__], 2))
+                work.append(item.right)
+                work.append(item.left)
+            elif t is ast.Constant:
+                values.append(item.value)
+            elif t is ast.UnaryOp:
+                work.append((_un_ops[item.op.__class__], 1))
+                work.append(item.operand)
+            elif t is ast.Expression:
+                work.append(item.body)
+            else:
+                # Um operador solto como raiz (ex.: ast.Add()) passa na validação
+                raise ValueError(
+                    f"Expressão contém elemento não permitido: {t.__name__}"
+                )
+        return values.pop()
+
+
+# O avaliador não tem estado, então uma única instância é reaproveitada
+_EVALUATOR = SafeEvaluator()
+
+
+# Caracteres que podem aparecer numa expressão válida: dígitos, operadores,
+# parênteses, espaços, continuação de linha (\) e o que os literais
+# numéricos aceitam (1e3, 1_000, 0x1F, 0o17, 0b101). Qualquer outro antes
+# de um comentário (#) é rejeitado antes do ast.parse.
+_ALLOWED_CHARS = frozenset("0123456789.+-*/%() \t\n\r\f\v\\eE_xXoObBaAcCdDfF")
+
+
+# Cache LRU de resultados e erros por expressão. Inteiros maiores que
+# _MAX_CACHED_INT_BITS não são guardados, para que expressões como
+# 2 ** 10 ** 8 (~40 MB) não fiquem vivas após a chamada.
+_CACHE_SIZE = 256
+_MAX_CACHED_INT_BITS = 4096
+_cache: OrderedDict[str, tuple[bool, Any]] = OrderedDict()
+
+
+def _evaluate(expression: str) -> tuple[bool, Any]:
+    """Avalia a expressão, retornando o resultado ou o erro como valor.
+
+    Retorna ``(True, valor)`` ou ``(False, (tipo_do_erro, mensagem))``. A
+    AST inteira é verificada antes de qualquer cálculo, então apenas
+    números e os operadores suportados chegam ao SafeEvaluator.
+    """
+    try:
+        # O texto de um comentário pode ter qualquer caractere
+        code = expression.partition("#")[0]
+        if not _ALLOWED_CHARS.issuperset(code):
+            char = next(c for c in code if c not in _ALLOWED_CHARS)
+            return False, (
+                ValueError,
+                f"Expressão contém caractere não permitido: {char!r}",
+            )
+        value = _EVALUATOR.evaluate(ast.parse(expression, mode="eval"))
+    except SyntaxError:
+        return False, (ValueError, "Expressão inválida")
+    except ValueError as exc:
+        return False, (ValueError, str(exc))
+    except ArithmeticError as exc:
+        return False, (exc.__class__, str(exc))
+    return True, value
+
+
+def _try_evaluate(expression: str) -> tuple[bool, Any]:
+    """Avalia a expressão sem levantar exceções para erros esperados.
+
+    Retorna ``(True, resultado)`` ou ``(False, (tipo_do_erro, mensagem))``.
+    Resultados e erros ficam no cache, então entradas repetidas (válidas
+    ou não) são respondidas sem parse nem exceções.
+    """
+    expression = expression.strip()
+    if not expression:
+        # Rejeita vazio/só espaços sem passar pelo parser
+        return False, (ValueError, "Expressão inválida")
+    outcome = _cache.pop(expression, None)
+    if outcome is None:
+        outcome = _evaluate(expression)
+        ok, value = outcome
+        if ok and value.__class__ is int and value.bit_length() > _MAX_CACHED_INT_BITS:
+            return outcome
+        if len(_cache) >= _CACHE_SIZE:
+            _cache.popitem(last=False)
+    # Reinsere no fim: a entrada passa a ser a usada mais recentemente
+    _cache[expression] = outcome
+    return outcome
 
 
 def evaluate_expression(expression: str) -> float:
     """Avalia a expressão matemática e retorna o resultado como float/int."""
-    try:
-        parsed = ast.parse(expression, mode="eval")
-    except SyntaxError as exc:
-        raise ValueError("Expressão inválida") from exc
-
-    evaluator = SafeEvaluator()
-    result = evaluator.visit(parsed)
-    return result
+    ok, payload = _try_evaluate(expression)
+    if ok:
+        return payload
+    error, message = payload
+    raise error(message)
 
 
 def _print_header() -> None:
@@ -104,11 +226,21 @@ def _print_header() -> None:
     print("Comandos: 'menu' volta ao menu, 'sair'|'quit'|'exit'|'q' encerra")
 
 
-EXIT_COMMANDS = {"sair", "quit", "exit", "q"}
-MENU_COMMANDS = {"menu", "m"}
+EXIT_COMMANDS = frozenset({"sair", "quit", "exit", "q"})
+MENU_COMMANDS = frozenset({"menu", "m"})
+
+# Classificação de comandos retornada por _classify
+_CMD_NONE = 0
+_CMD_EXIT = 1
+_CMD_MENU = 2
+
+_COMMAND_KINDS: Mapping[str, int] = {
+    **dict.fromkeys(EXIT_COMMANDS, _CMD_EXIT),
+    **dict.fromkeys(MENU_COMMANDS, _CMD_MENU),
+}
 
 # Mapeamento direto símbolo -> função
-OP_SYMBOL_TO_FUNC: Mapping[str, Callable[[SafeEvaluator.Number, SafeEvaluator.Number], SafeEvaluator.Number]] = {
+OP_SYMBOL_TO_FUNC: Mapping[str, _BinaryFunc] = {
     "+": operator.add,
     "-": operator.sub,
     "*": operator.mul,
@@ -119,15 +251,12 @@ OP_SYMBOL_TO_FUNC: Mapping[str, Callable[[SafeEvaluator.Number, SafeEvaluator.Nu
 }
 
 
-def _is_exit(cmd: str) -> bool:
-    return cmd.lower() in EXIT_COMMANDS
-
+def _classify(cmd: str) -> int:
+    """Classifica a entrada como _CMD_EXIT, _CMD_MENU ou _CMD_NONE."""
+    return _COMMAND_KINDS.get(cmd.lower(), _CMD_NONE)
 
-def _is_menu(cmd: str) -> bool:
-    return cmd.lower() in MENU_COMMANDS
 
-
-def _parse_number_input(prompt: str) -> Optional[SafeEvaluator.Number]:
+def _parse_number_input(prompt: str) -> Optional[Number]:
     """Lê um número do usuário.
 
     Retorna None quando o usuário pede 'menu'.
@@ -135,18 +264,24 @@ def _parse_number_input(prompt: str) -> Optional[SafeEvaluator.Number]:
     """
     while True:
         s = input(prompt).strip()
-        if _is_exit(s):
+        kind = _classify(s)
+        if kind == _CMD_EXIT:
             raise SystemExit(0)
-        if _is_menu(s):
+        if kind == _CMD_MENU:
             return None
         try:
-            # Aceita int ou float
+            # Caminho rápido (e sem perda de precisão) para inteiros
+            return int(s)
+        except ValueError:
+            pass
+        try:
             value = float(s)
-            if value.is_integer():
-                return int(value)
-            return value
         except ValueError:
             print("Entrada inválida. Digite um número, 'menu' ou 'sair'.")
+            continue
+        if value.is_integer():
+            return int(value)
+        return value
 
 
 def _choose_operation() -> Optional[str]:
@@ -159,17 +294,18 @@ def _choose_operation() -> Optional[str]:
     ops = " ".join(OP_SYMBOL_TO_FUNC.keys())
     while True:
         s = input(f"Operação ({ops}): ").strip()
-        if _is_exit(s):
+        kind = _classify(s)
+        if kind == _CMD_EXIT:
             raise SystemExit(0)
-        if _is_menu(s):
+        if kind == _CMD_MENU:
             return None
         if s in OP_SYMBOL_TO_FUNC:
             return s
         print("Operação inválida. Use um dos símbolos listados, 'menu' ou 'sair'.")
 
 
-def _guided_loop() -> None:
-    print("Modo guiado: informe números e operação. ('menu' volta, 'sair' encerra)")
+def _guided_loop(_print: Callable[..., None] = print) -> None:
+    _print("Modo guiado: informe números e operação. ('menu' volta, 'sair' encerra)")
     while True:
         first = _parse_number_input("Primeiro número: ")
         if first is None:
@@ -183,40 +319,44 @@ def _guided_loop() -> None:
         try:
             func = OP_SYMBOL_TO_FUNC[op]
             result = func(first, second)
-            print(f"Resultado: {result}")
+            _print(f"Resultado: {result}")
         except ZeroDivisionError:
-            print("Erro: divisão por zero não é permitida.")
+            _print("Erro: divisão por zero não é permitida.")
 
 
-def _expression_loop() -> None:
-    print("Modo expressão: digite expressões. ('menu' volta, 'sair' encerra)")
+def _expression_loop(
+    _input: Callable[[str], str] = input,
+    _print: Callable[..., None] = print,
+) -> None:
+    _print("Modo expressão: digite expressões. ('menu' volta, 'sair' encerra)")
     while True:
-        expr = input(">>> ").strip()
-        if _is_exit(expr):
+        expr = _input(">>> ").strip()
+        kind = _classify(expr)
+        if kind == _CMD_EXIT:
             raise SystemExit(0)
-        if _is_menu(expr):
+        if kind == _CMD_MENU:
             return
         if not expr:
             continue
         try:
-            result = evaluate_expression(expr)
+            ok, result = _try_evaluate(expr)
         except Exception as exc:  # noqa: BLE001 - CLI amigável
-            print(f"Erro: {exc}")
-            continue
-        print(result)
+            ok, result = False, (exc.__class__, str(exc))
+        _print(result if ok else f"Erro: {result[1]}")
 
 
 def main(argv: list[str]) -> int:
     if argv:
         expr = " ".join(argv)
         try:
-            result = evaluate_expression(expr)
+            ok, result = _try_evaluate(expr)
         except Exception as exc:  # noqa: BLE001 - CLI amigável
-            print(f"Erro: {exc}", file=sys.stderr)
+            ok, result = False, (exc.__class__, str(exc))
+        if not ok:
+            print(f"Erro: {result[1]}", file=sys.stderr)
             return 1
-        else:
-            print(result)
-            return 0
+        print(result)
+        return 0
 
     _print_header()
     while True:
@@ -226,7 +366,7 @@ def main(argv: list[str]) -> int:
             print()
             break
 
-        if _is_exit(choice):
+        if _classify(choice) == _CMD_EXIT:
             break
         if choice in {"1", "g", "G"}:
             try: